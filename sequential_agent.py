@@ -2,59 +2,124 @@ import streamlit as st
 import os
 from dotenv import load_dotenv
 import traceback
+import ast
+import builtins
+import html
+import operator
+import re
+import json
+import uuid
+import threading
+import hashlib
+import concurrent.futures
+from dataclasses import dataclass
+from typing import Any
+from types import SimpleNamespace
 
 # Attempt to import ADK components
-try:
+@st.cache_resource(show_spinner=False)
+def _load_adk():
+    """Resolves the ADK and GenAI imports once per process; an ImportError propagates, so a failure is never cached."""
     from google.adk.agents.sequential_agent import SequentialAgent
     from google.adk.agents.llm_agent import LlmAgent
+    from google.adk.agents.base_agent import BaseAgent
+    from google.adk.events import Event, EventActions
     from google.adk.sessions import InMemorySessionService
     from google.adk.runners import Runner
-    from google.adk.tools import built_in_code_execution
-    ADK_AVAILABLE = True
-except ImportError as e:
-    st.error(f"Required Google ADK libraries not found. Error: {e}. Please ensure 'google.adk' is installed or accessible.")
-    ADK_AVAILABLE = False
-
-    # Define dummy classes/functions
-    class DummyAgent:
-        def __init__(self, *args, **kwargs): pass
-
-    class DummySessionService:
-        def create_session(self, *args, **kwargs): return type('obj', (object,), {'state': {}})()
-        def get_session(self, *args, **kwargs): return type('obj', (object,), {'state': {}})()
-
-    class DummyRunner:
-        def __init__(self, *args, **kwargs): pass
-        def run(self, *args, **kwargs):
-            st.warning("ADK Runner is unavailable.")
-            yield type('obj', (object,), {'is_final_response': lambda: True, 'content': type('obj', (object,), {'parts': [type('obj', (object,), {'text': 'ADK Libraries unavailable.'})()]})()})()
-
-    built_in_code_execution = None
-    SequentialAgent, LlmAgent, InMemorySessionService, Runner = DummyAgent, DummyAgent, DummySessionService, DummyRunner
-
-# Attempt to import GenAI types
-try:
+    from google.adk.agents.run_config import RunConfig, StreamingMode
+    from google.adk.models import Gemini
+    from google.genai import Client
     from google.genai import types as genai_types
-    GENAI_TYPES_AVAILABLE = True
-except ImportError:
-    st.warning("google-generativeai library not found.")
-    GENAI_TYPES_AVAILABLE = False
-    genai_types = type('obj', (object,), {'Content': lambda **kwargs: type('obj', (object,), kwargs)(), 'Part': lambda **kwargs: type('obj', (object,), kwargs)()})
+    from google.adk.tools import built_in_code_execution
+    from pydantic import BaseModel, Field
+    return SimpleNamespace(
+        available=True, error=None,
+        SequentialAgent=SequentialAgent, LlmAgent=LlmAgent, InMemorySessionService=InMemorySessionService, Runner=Runner,
+        BaseAgent=BaseAgent, Event=Event, EventActions=EventActions,
+        RunConfig=RunConfig, StreamingMode=StreamingMode,
+        Gemini=Gemini, Client=Client, built_in_code_execution=built_in_code_execution,
+        BaseModel=BaseModel, Field=Field, genai_types=genai_types
+    )
+
+def _adk():
+    """Returns the cached ADK namespace, or dummies while the libraries are missing; only success is cached."""
+    try:
+        return _load_adk()
+    except ImportError as e:
+        # Define dummy classes/functions
+        class DummyAgent:
+            def __init__(self, *args, **kwargs): pass
+
+        class DummySessionService:
+            def create_session(self, *args, **kwargs): return type('obj', (object,), {'state': {}})()
+            def get_session(self, *args, **kwargs): return type('obj', (object,), {'state': {}})()
+
+        class DummyRunner:
+            def __init__(self, *args, **kwargs): pass
+            def run(self, *args, **kwargs):
+                st.warning(RUNNER_UNAVAILABLE_WARNING)
+                yield type('obj', (object,), {'is_final_response': lambda: True, 'content': type('obj', (object,), {'parts': [type('obj', (object,), {'text': 'ADK Libraries unavailable.'})()]})()})()
+
+        return SimpleNamespace(
+            available=False, error=e,
+            SequentialAgent=DummyAgent, LlmAgent=DummyAgent, InMemorySessionService=DummySessionService, Runner=DummyRunner,
+            BaseAgent=DummyAgent, Event=None, EventActions=None,
+            RunConfig=DummyAgent, StreamingMode=type('obj', (object,), {'SSE': None}),
+            Gemini=DummyAgent, Client=None, built_in_code_execution=None,
+            BaseModel=object, Field=lambda **kwargs: None,
+            genai_types=type('obj', (object,), {'Content': lambda **kwargs: type('obj', (object,), kwargs)(), 'Part': lambda **kwargs: type('obj', (object,), kwargs)()})
+        )
+
+adk = _adk()
+genai_types = adk.genai_types
+
+# Optional syntax highlighting for the results panel
+@st.cache_resource(show_spinner=False)
+def _pygments():
+    """Imports Pygments once per process, on first use; an ImportError propagates, so a missing install is not cached."""
+    from pygments import highlight
+    from pygments.lexers import PythonLexer
+    from pygments.formatters import HtmlFormatter
+    return SimpleNamespace(highlight=highlight, PythonLexer=PythonLexer, HtmlFormatter=HtmlFormatter)
 
 # Load Environment Variables
-load_dotenv()
+@st.cache_resource(show_spinner=False)
+def _boot():
+    """Loads .env once per process instead of re-reading it on every rerun."""
+    load_dotenv()
+    return True
+
+_boot()
 
 # Constants
 APP_NAME = "streamlit_code_pipeline_generator"
 USER_ID = "streamlit_user_01"
 SESSION_ID_PREFIX = "pipeline_session_"
 GEMINI_MODEL = "gemini-2.0-flash"
+INFLIGHT_TIMEOUT_S = 120
+
+# UI Text
+RUNNING_LABEL = "🤖 Running the code generation pipeline..."
+WAITING_LABEL = "⏳ An identical request is already running; waiting for its results..."
+EMPTY_STATE_WARNING = "Pipeline finished, but session state appears empty."
+EMPTY_QUERY_WARNING = "Please enter a description for the code."
+MISSING_LIBRARIES_ERROR = "Cannot run pipeline: Required libraries missing."
+ADK_MISSING_ERROR = "Required Google ADK libraries not found. Error: {}. Please ensure 'google.adk' is installed or accessible."
+RUNNER_UNAVAILABLE_WARNING = "ADK Runner is unavailable."
+FINISHED_MESSAGE = "Pipeline finished!"
+RUN_ERROR = "An error occurred during pipeline execution: {}"
+FAILED_RESULTS_ERROR = "Pipeline execution failed."
+ADK_MISSING_RESULTS_INFO = "Enter a request and click 'Run Debug Pipeline' once ADK libraries are available."
+IDLE_RESULTS_INFO = "Enter a request on the left to see the results here."
 
 # Set page config as the first Streamlit command
 st.set_page_config(page_title="AI Code Pipeline", layout="wide", page_icon="🚀")
 
+if not adk.available:
+    st.error(ADK_MISSING_ERROR.format(adk.error))
+
 # Custom CSS for additional styling
-st.markdown("""
+_CSS = """
 <style>
     .main {
         background-color: #1e1e1e;
@@ -73,54 +138,109 @@ st.markdown("""
         margin-right: 10px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+# Re-emitted on every run: Streamlit drops elements a rerun does not redraw.
+st.markdown(_CSS, unsafe_allow_html=True)
+
+# Shared Model Client
+_run_clients = threading.local()
+
+class PooledGemini(adk.Gemini):
+    """Gemini model that gives every agent in a pipeline run the same genai Client.
+
+    A model given as a string is resolved to a new Gemini, with a new HTTP client,
+    on every LLM call. Runner.run drives each run on its own thread and event loop,
+    so the client is kept per thread: the agents of one run share a warm connection
+    pool without reusing async connections across event loops.
+    """
+
+    @property
+    def api_client(self):
+        client = getattr(_run_clients, 'client', None)
+        if client is None:
+            client = _run_clients.client = adk.Client(
+                http_options=genai_types.HttpOptions(headers=self._tracking_headers)
+            )
+        return client
 
 # Agent Definitions and Initialization
-if ADK_AVAILABLE:
-    if 'code_writer_agent' not in st.session_state:
-        st.session_state.code_writer_agent = LlmAgent(
-            name="CodeWriterAgent", model=GEMINI_MODEL,
-            instruction="Write Python code based on user request. Output only raw code in ```python ... ```.",
-            description="Writes initial code.", output_key="generated_code"
+class CodeAndReview(adk.BaseModel):
+    """Structured output of the combined write-and-review step."""
+    code: str = adk.Field(description="The complete Python code, without markdown fences.")
+    review: str = adk.Field(description="Review comments on the code as bullet points (*).")
+
+class CodeStaticLintAgent(adk.BaseAgent):
+    """Lints the generated code in-process with static_lint(); no LLM call is made."""
+
+    async def _run_async_impl(self, ctx):
+        code_and_review = ctx.session.state.get("code_and_review") or {}
+        report = static_lint(clean_code_output(code_and_review.get("code")))
+        yield adk.Event(
+            author=self.name, invocation_id=ctx.invocation_id, branch=ctx.branch,
+            content=genai_types.Content(role='model', parts=[genai_types.Part(text=report)]),
+            actions=adk.EventActions(state_delta={"lint_report": report})
         )
 
-    if 'code_reviewer_agent' not in st.session_state:
-        st.session_state.code_reviewer_agent = LlmAgent(
-            name="CodeReviewerAgent",
-            model=GEMINI_MODEL,
-            instruction="""You are a Code Reviewer AI.
-Review the Python code provided in the session state under the key 'generated_code'.
-Provide constructive feedback as bullet points (*). Focus on:
+@dataclass
+class CodePipeline:
+    """Agents, session service and runner shared by every browser session."""
+    code_write_review_agent: adk.LlmAgent
+    code_static_lint_agent: CodeStaticLintAgent
+    code_refactorer_agent: adk.LlmAgent
+    code_interpreter_agent: adk.LlmAgent
+    code_pipeline_agent: adk.SequentialAgent
+    session_service: adk.InMemorySessionService
+    runner: adk.Runner
+
+@st.cache_resource
+def get_pipeline():
+    """Builds the code pipeline once per process; reruns and other tabs reuse it."""
+    model = PooledGemini(model=GEMINI_MODEL)
+
+    # Writing and reviewing in one structured response saves a full prefill and decode of the code.
+    code_write_review_agent = adk.LlmAgent(
+        name="CodeWriteReviewAgent",
+        model=model,
+        output_schema=CodeAndReview,
+        # ADK requires structured-output agents to opt out of transfers; saying so avoids its config-error log.
+        disallow_transfer_to_parent=True, disallow_transfer_to_peers=True,
+        instruction="""You are a Python Code Writer and Reviewer AI.
+Write Python code based on the user request, then review the code you wrote.
+Respond with a JSON object with these fields:
+'code': the complete Python code only, without markdown fences.
+'review': constructive feedback on that code as bullet points (*). Focus on:
 * Potential bugs or errors.
 * Adherence to Python best practices (PEP 8).
 * Possible improvements for clarity, efficiency, or robustness.
 * Missing error handling or edge cases.
-Output only the review comments. Do not include the code itself in your output.
 """,
-            description="Reviews code and provides feedback.", output_key="review_comments"
-        )
-
-    if 'code_refactorer_agent' not in st.session_state:
-        st.session_state.code_refactorer_agent = LlmAgent(
-            name="CodeRefactorerAgent",
-            model=GEMINI_MODEL,
-            instruction="""You are a Code Refactorer AI.
-Take the original Python code provided in the session state key 'generated_code'
-and the review comments found in the session state key 'review_comments'.
-Refactor the original code *strictly* based on the provided review comments to improve its quality, clarity, and correctness.
-If the review comments are empty or non-actionable, return the original code.
+        description="Writes initial code and reviews it.", output_key="code_and_review"
+    )
+
+    code_static_lint_agent = CodeStaticLintAgent(
+        name="CodeStaticLintAgent",
+        description="Statically analyses the generated code for lint issues."
+    )
+
+    code_refactorer_agent = adk.LlmAgent(
+        name="CodeRefactorerAgent",
+        model=model,
+        instruction="""You are a Code Refactorer AI.
+Take the original Python code and review comments provided in the session state key 'code_and_review'
+(its 'code' and 'review' fields), and the static analysis findings found in the session state key 'lint_report'.
+Refactor the original code *strictly* based on the provided review comments and lint findings to improve its quality, clarity, and correctness.
+If the review comments and lint findings are empty or non-actionable, return the original code.
 Output *only* the final, refactored Python code block, enclosed in triple backticks (```python ... ```).
 """,
-            description="Refactors code based on review comments.", output_key="refactored_code"
-        )
-
-    if 'code_interpreter_agent' not in st.session_state:
-        st.session_state.code_interpreter_agent = LlmAgent(
-            name="CodeInterpreterAgent",
-            model=GEMINI_MODEL,
-            tools=[built_in_code_execution],
-            instruction="""You are a Code Execution Assistant.
-1. Examine the session state for Python code, prioritizing the key 'refactored_code'. If it's empty or absent, use the code from 'generated_code'.
+        description="Refactors code based on review comments.", output_key="refactored_code"
+    )
+
+    code_interpreter_agent = adk.LlmAgent(
+        name="CodeInterpreterAgent",
+        model=model,
+        tools=[adk.built_in_code_execution],
+        instruction="""You are a Code Execution Assistant.
+1. Examine the session state for Python code, prioritizing the key 'refactored_code'. If it's empty or absent, use the 'code' field of 'code_and_review'.
 2. Extract *only* the raw Python code from the relevant state key (remove markdown fences like ```python).
 3. If code is found, execute it using the provided code execution tool.
 - For code defining functions/classes without direct execution, add simple example usage if feasible (e.g., call a function with sample inputs) to test its execution. Run scripts directly.
@@ -128,45 +248,241 @@ Output *only* the final, refactored Python code block, enclosed in triple backti
 Execution Outcome: [Success/Failure]
 Output:
 [Captured stdout/stderr or 'No output captured.']""",
-            description="Executes the generated/refactored code and reports the outcome.", output_key="execution_summary"
-        )
-
-    if 'code_pipeline_agent' not in st.session_state:
-        st.session_state.code_pipeline_agent = SequentialAgent(
-            name="CodePipelineAgent_Debug",
-            sub_agents=[
-                st.session_state.code_writer_agent,
-                st.session_state.code_reviewer_agent,
-                st.session_state.code_refactorer_agent,
-                st.session_state.code_interpreter_agent
-            ]
-        )
-
-    if 'session_service' not in st.session_state:
-        st.session_state.session_service = InMemorySessionService()
-
-    if 'runner' not in st.session_state:
-        st.session_state.runner = Runner(
-            agent=st.session_state.code_pipeline_agent,
-            app_name=APP_NAME,
-            session_service=st.session_state.session_service
-        )
+        description="Executes the generated/refactored code and reports the outcome.", output_key="execution_summary"
+    )
+
+    code_pipeline_agent = adk.SequentialAgent(
+        name="CodePipelineAgent_Debug",
+        sub_agents=[
+            code_write_review_agent,
+            code_static_lint_agent,
+            code_refactorer_agent,
+            code_interpreter_agent
+        ]
+    )
+
+    session_service = adk.InMemorySessionService()
+
+    runner = adk.Runner(
+        agent=code_pipeline_agent,
+        app_name=APP_NAME,
+        session_service=session_service
+    )
+
+    return CodePipeline(
+        code_write_review_agent=code_write_review_agent,
+        code_static_lint_agent=code_static_lint_agent,
+        code_refactorer_agent=code_refactorer_agent,
+        code_interpreter_agent=code_interpreter_agent,
+        code_pipeline_agent=code_pipeline_agent,
+        session_service=session_service,
+        runner=runner
+    )
+
+pipeline = get_pipeline() if adk.available else None
+
+@dataclass
+class InflightRuns:
+    """Pipeline runs in progress across all browser sessions, keyed by a hash of the request."""
+    lock: threading.Lock
+    futures: dict
+
+@st.cache_resource
+def _inflight():
+    return InflightRuns(lock=threading.Lock(), futures={})
+
+@dataclass(slots=True)
+class EventRow:
+    """One captured pipeline event for the raw debug view."""
+    index: int
+    id: str
+    author: str
+    is_final: bool
+    interrupted: Any
+    error_code: Any
+    error_message: Any
+    content_parts: list
+
+# Event field accessors, bound once instead of probing with getattr/hasattr per event
+_evt_attrs = operator.attrgetter('id', 'author', 'partial', 'interrupted', 'error_code', 'error_message')
+_part_attrs = operator.attrgetter('text', 'executable_code', 'code_execution_result')
 
 # Helper Function
 def clean_code_output(text):
-    if text is None: return ""
+    if not text: return ""
     text = text.strip()
     if text.startswith("```python"): text = text[len("```python"):].strip()
     elif text.startswith("```"): text = text[len("```"):].strip()
     if text.endswith("```"): text = text[:-len("```")].strip()
     return text
 
+_BUILTIN_NAMES = frozenset(dir(builtins))
+_MUTABLE_LITERALS = (ast.List, ast.Dict, ast.Set, ast.ListComp, ast.DictComp, ast.SetComp)
+
+def static_lint(code):
+    """Checks Python code with the ast module, without running it, and returns the findings as bullet points."""
+    if not code: return "No code to lint."
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return f"* Line {e.lineno}: SyntaxError: {e.msg}"
+
+    findings, imported, used = [], {}, set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if isinstance(node, ast.ImportFrom) and node.module == "__future__": continue
+            for alias in node.names:
+                if alias.name != "*": imported.setdefault(alias.asname or alias.name.split(".")[0], node.lineno)
+        elif isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load): used.add(node.id)
+            elif node.id in _BUILTIN_NAMES: findings.append((node.lineno, f"'{node.id}' shadows a built-in"))
+        elif isinstance(node, ast.ExceptHandler) and node.type is None:
+            findings.append((node.lineno, "bare 'except:'"))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            if not isinstance(node, ast.Lambda) and node.name in _BUILTIN_NAMES:
+                findings.append((node.lineno, f"function '{node.name}' shadows a built-in"))
+            args = node.args
+            for arg in args.posonlyargs + args.args + args.kwonlyargs:
+                if arg.arg in _BUILTIN_NAMES: findings.append((arg.lineno, f"argument '{arg.arg}' shadows a built-in"))
+            for default in args.defaults + [d for d in args.kw_defaults if d is not None]:
+                if isinstance(default, _MUTABLE_LITERALS): findings.append((default.lineno, "mutable default argument"))
+
+    findings += [(lineno, f"'{name}' imported but unused") for name, lineno in imported.items() if name not in used]
+    if not findings: return "No lint findings."
+    return "\n".join(f"* Line {lineno}: {message}" for lineno, message in sorted(findings))
+
+def pipeline_stream(events, event_list_for_debug=None):
+    """Yields (author, text, partial, is_final) for each pipeline event.
+
+    Partial (SSE) events carry token deltas; the closing event of a response carries its full text.
+    When event_list_for_debug is a list, an EventRow is appended to it for every event.
+    """
+    for i, event in enumerate(events):
+        try:
+            event_id, author, partial, interrupted, error_code, error_message = _evt_attrs(event)
+        except AttributeError:
+            event_id, author, partial = getattr(event, 'id', 'N/A'), getattr(event, 'author', 'N/A'), getattr(event, 'partial', False)
+            interrupted, error_code, error_message = getattr(event, 'interrupted', None), getattr(event, 'error_code', None), getattr(event, 'error_message', None)
+        is_final = event.is_final_response()
+        try:
+            parts = event.content.parts or ()
+        except AttributeError:
+            parts = ()
+
+        if event_list_for_debug is not None:
+            # Code parts are kept as objects; st.json only serializes them when rendered.
+            content_parts = []
+            for part in parts:
+                try:
+                    part_text, executable_code, code_execution_result = _part_attrs(part)
+                except AttributeError:
+                    part_text, executable_code, code_execution_result = getattr(part, 'text', None), None, None
+                part_info = {}
+                if part_text: part_info['text'] = part_text
+                if executable_code is not None: part_info['executable_code'] = executable_code
+                if code_execution_result is not None: part_info['code_execution_result'] = code_execution_result
+                if part_info:
+                    content_parts.append(part_info)
+
+            event_list_for_debug.append(EventRow(
+                index=i,
+                id=event_id,
+                author=author,
+                is_final=is_final,
+                interrupted=interrupted,
+                error_code=error_code,
+                error_message=error_message,
+                content_parts=content_parts
+            ))
+
+        yield author, "".join(part.text for part in parts if getattr(part, 'text', None)), partial, is_final
+
+# 'code' is the first field of CodeAndReview, so the streamed JSON object opens with its string value.
+_STREAMED_CODE_RE = re.compile(r'\A\s*\{\s*"code"\s*:\s*"((?:[^"\\]|\\(?:u[0-9a-fA-F]{4}|[^u]))*)')
+
+def streamed_code(buffer):
+    """Decodes as much of the 'code' string as has streamed in the write-and-review agent's partial JSON."""
+    match = _STREAMED_CODE_RE.match(buffer)
+    if not match: return ""
+    code = json.loads(f'"{match.group(1)}"', strict=False)
+    # A surrogate pair split across chunks leaves a lone high surrogate until its second half arrives.
+    return code[:-1] if code and "\ud800" <= code[-1] <= "\udbff" else code
+
+def parsed_review(text):
+    """Returns the 'review' field of the write-and-review agent's final JSON, or "" if it does not parse."""
+    try:
+        return json.loads(text).get("review") or ""
+    except (ValueError, AttributeError):
+        return ""
+
+def step_panels():
+    """Lays out the four step expanders and returns an empty slot per streamed agent, keyed by author, plus one
+    for the review, which is filled from the write-and-review agent's final JSON."""
+    with st.expander("🖋️ Step 1: Initial Code Generation", expanded=True):
+        writer_slot = st.empty()
+    with st.expander("🔍 Step 2: Code Review & Static Analysis", expanded=True):
+        reviewer_slot, linter_slot = st.empty(), st.empty()
+    with st.expander("🔧 Step 3: Refactored Code", expanded=True):
+        refactorer_slot = st.empty()
+    with st.expander("🚀 Step 4: Code Execution", expanded=True):
+        interpreter_slot = st.empty()
+    return {
+        "CodeWriteReviewAgent": writer_slot,
+        "review": reviewer_slot,
+        "CodeStaticLintAgent": linter_slot,
+        "CodeRefactorerAgent": refactorer_slot,
+        "CodeInterpreterAgent": interpreter_slot
+    }
+
+def _pre(text):
+    """Escapes text for a <pre> block and keeps it on one source line, so Markdown treats the blob as raw HTML."""
+    return f"<pre style='white-space: pre-wrap'>{html.escape(text)}</pre>".replace("\n", "&#10;")
+
+def _code_html(code):
+    try:
+        pygments = _pygments()
+    except ImportError:
+        return _pre(code)
+    return pygments.highlight(
+        code, pygments.PythonLexer(), pygments.HtmlFormatter(noclasses=True, style="monokai")
+    ).replace("\n", "&#10;")
+
+def results_html(results):
+    """Renders the step panels and the final code as one HTML blob, so each rerun sends a single element."""
+    code = results.get("generated_code_clean")
+    code_html = _code_html(code) if code else None
+
+    def state_output(label, value):
+        return _pre(f"{label}: {value}" if value else f"{label}: None")
+
+    return "".join([
+        "<details open><summary>🖋️ Step 1: Initial Code Generation</summary>",
+        code_html or "<p>⚠️ No code generated or retrieved.</p>",
+        "</details><details open><summary>🔍 Step 2: Code Review &amp; Static Analysis</summary>",
+        state_output("State Output", results.get("review_comments")),
+        state_output("Lint Output", results.get("lint_report")),
+        "</details><details open><summary>🔧 Step 3: Refactored Code</summary>",
+        state_output("State Output", results.get("refactored_code")),
+        "</details><details open><summary>🚀 Step 4: Code Execution</summary>",
+        state_output("State Output", results.get("execution_summary")),
+        "</details><hr><h3>🎉 Final Generated Code</h3>",
+        code_html or "<p>❌ Could not retrieve the generated code from session state.</p>",
+        "<hr><p style='font-size: 0.8em; opacity: 0.6'>Powered by Streamlit and Google ADK</p>",
+    ])
+
 # Streamlit UI
 st.title("🚀 AI Code Generation Pipeline")
-st.markdown("Enter a description of the Python code you want to generate. The pipeline will write, review, refactor, and execute the code.")
+st.markdown("Enter a description of the Python code you want to generate. The pipeline will write, review and lint, refactor, and execute the code.")
+
+debug_mode = st.sidebar.checkbox("Capture raw events", value=False, help="Record every pipeline event for the debug JSON view and show full tracebacks on errors.")
 
 col1, col2 = st.columns([1, 1])
 
+# Laid out before the request column runs so the pipeline can stream into it.
+with col2:
+    st.subheader("2. Agent Pipeline Results")
+    results_area = st.empty()
+
 with col1:
     st.subheader("1. Your Request")
     with st.form(key='my_form'):
@@ -175,129 +491,137 @@ with col1:
             height=150,
             placeholder="e.g., Write a Python function to calculate the factorial of a number."
         )
-        submit_button = st.form_submit_button(label='🤖 Run Code Generator Pipeline', disabled=not ADK_AVAILABLE)
-
-    session_counter = st.session_state.get('session_counter', 0)
-    current_session_id = f"{SESSION_ID_PREFIX}{session_counter}"
+        submit_button = st.form_submit_button(label='🤖 Run Code Generator Pipeline', disabled=not adk.available)
 
     if submit_button:
-        if user_query and ADK_AVAILABLE and GENAI_TYPES_AVAILABLE:
+        if user_query and adk.available:
+            # The session service is shared process-wide, so session IDs must be unique per browser session.
+            if 'session_prefix' not in st.session_state:
+                st.session_state.session_prefix = f"{SESSION_ID_PREFIX}{uuid.uuid4().hex[:8]}_"
+            session_counter = st.session_state.get('session_counter', 0)
+            current_session_id = f"{st.session_state.session_prefix}{session_counter}"
             st.session_state.session_counter = session_counter + 1
             st.session_state.results = {}
             st.session_state.error = None
             st.session_state.ran_query = user_query
 
+            # Identical concurrent requests share one pipeline run: the first caller runs it, the rest wait on its future.
+            query_key = hashlib.sha256(user_query.encode()).hexdigest()
+            inflight = _inflight()
+            with inflight.lock:
+                future = inflight.futures.get(query_key)
+                is_leader = future is None
+                if is_leader:
+                    future = inflight.futures[query_key] = concurrent.futures.Future()
+
             try:
-                session_service = st.session_state.session_service
-                runner = st.session_state.runner
+                if not is_leader:
+                    with st.spinner(WAITING_LABEL):
+                        st.session_state.results = future.result(timeout=INFLIGHT_TIMEOUT_S)
+                    st.success(FINISHED_MESSAGE)
+                else:
+                    session_service = pipeline.session_service
+                    runner = pipeline.runner
+
+                    session = session_service.create_session(
+                        app_name=APP_NAME, user_id=USER_ID, session_id=current_session_id
+                    )
+
+                    initial_content = genai_types.Content(role='user', parts=[genai_types.Part(text=user_query)])
+
+                    with results_area.container():
+                        slots = step_panels()
+
+                    with st.status(RUNNING_LABEL, expanded=False) as status:
+                        events = runner.run(
+                            user_id=USER_ID, session_id=current_session_id, new_message=initial_content,
+                            run_config=adk.RunConfig(streaming_mode=adk.StreamingMode.SSE)
+                        )
+
+                        event_list_for_debug = []
+                        final_response_text = "Pipeline completed."
+                        buffers = {}
+                        # The stream is drained rather than closed on the interpreter's first final event: with SSE and
+                        # code execution, text preceding an executable_code part arrives as its own final event, so an
+                        # early break could miss the real execution summary. Runner.run ends right after that agent anyway.
+                        for author, text, partial, is_final in pipeline_stream(events, event_list_for_debug if debug_mode else None):
+                            if text:
+                                buffers[author] = buffers.get(author, "") + text if partial else text
+                                slot = slots.get(author)
+                                if slot is not None:
+                                    # The write-and-review step streams a JSON object: show its code as it arrives, its review once complete.
+                                    if author == "CodeWriteReviewAgent":
+                                        slot.code(streamed_code(buffers[author]), language="python")
+                                        if is_final: slots["review"].text(parsed_review(text))
+                                    else: slot.text(buffers[author])
+
+                            if is_final:
+                                status.update(label=f"{author} done")
+                                if text: final_response_text = text
+
+                        status.update(label="Pipeline run complete", state="complete")
+
+                    if debug_mode:
+                        with st.expander("Raw pipeline events", expanded=False):
+                            st.json([{f: getattr(row, f) for f in EventRow.__slots__} for row in event_list_for_debug], expanded=False)
+
+                    updated_session = session_service.get_session(
+                        session_id=current_session_id, app_name=APP_NAME, user_id=USER_ID
+                    )
+                    session_state = updated_session.state if updated_session and hasattr(updated_session, 'state') else {}
 
-                session = session_service.create_session(
-                    app_name=APP_NAME, user_id=USER_ID, session_id=current_session_id
-                )
+                    code_and_review = session_state.get("code_and_review") or {}
 
-                initial_content = genai_types.Content(role='user', parts=[genai_types.Part(text=user_query)])
+                    st.session_state.results = {
+                        "generated_code": code_and_review.get("code"),
+                        "generated_code_clean": clean_code_output(code_and_review.get("code")),
+                        "review_comments": code_and_review.get("review"),
+                        "lint_report": session_state.get("lint_report"),
+                        "refactored_code": session_state.get("refactored_code"),
+                        "execution_summary": session_state.get("execution_summary"),
+                        "final_message": final_response_text
+                    }
 
-                with st.spinner("🤖 Running the code generation pipeline..."):
-                    events = runner.run(
-                        user_id=USER_ID, session_id=current_session_id, new_message=initial_content
-                    )
+                    st.session_state.results["html"] = results_html(st.session_state.results)
+                    future.set_result(st.session_state.results)
 
-                    event_list_for_debug = []
-                    final_response_text = "Pipeline completed."
-                    for i, event in enumerate(events):
-                        event_details = {
-                            "index": i,
-                            "id": getattr(event, 'id', 'N/A'),
-                            "author": getattr(event, 'author', 'N/A'),
-                            "is_final": event.is_final_response(),
-                            "interrupted": getattr(event, 'interrupted', None),
-                            "error_code": getattr(event, 'error_code', None),
-                            "error_message": getattr(event, 'error_message', None),
-                            "content_parts": []
-                        }
-                        if hasattr(event, 'content') and event.content and hasattr(event.content, 'parts') and event.content.parts:
-                            for part in event.content.parts:
-                                part_info = {}
-                                if hasattr(part, 'text') and part.text: part_info['text'] = part.text
-                                if hasattr(part, 'executable_code'): part_info['executable_code'] = str(part.executable_code)
-                                if hasattr(part, 'code_execution_result'): part_info['code_execution_result'] = str(part.code_execution_result)
-                                if part_info:
-                                    event_details["content_parts"].append(part_info)
-
-                        event_list_for_debug.append(event_details)
-
-                        if event.is_final_response():
-                            if hasattr(event, 'content') and event.content and hasattr(event.content, 'parts') and event.content.parts:
-                                first_part = event.content.parts[0]
-                                if hasattr(first_part, 'text') and first_part.text:
-                                    final_response_text = first_part.text
-
-                    st.json(event_list_for_debug, expanded=False)
-
-                updated_session = session_service.get_session(
-                    session_id=current_session_id, app_name=APP_NAME, user_id=USER_ID
-                )
-                session_state = updated_session.state if updated_session and hasattr(updated_session, 'state') else {}
-
-                st.session_state.results = {
-                    "generated_code": session_state.get("generated_code"),
-                    "review_comments": session_state.get("review_comments"),
-                    "refactored_code": session_state.get("refactored_code"),
-                    "execution_summary": session_state.get("execution_summary"),
-                    "final_message": final_response_text
-                }
-
-                if session_state: st.success("Pipeline finished!")
-                else: st.warning("Pipeline finished, but session state appears empty.")
+                    if session_state: st.success(FINISHED_MESSAGE)
+                    else: st.warning(EMPTY_STATE_WARNING)
 
             except Exception as e:
-                st.error(f"An error occurred during pipeline execution: {e}")
-                st.code(traceback.format_exc())
-                st.session_state.error = str(e)
+                # The result may already be set when a later step, such as rendering, raises.
+                if is_leader and not future.done(): future.set_exception(e)
+                st.session_state.error = f"{e.__class__.__name__}: {e}"
+                st.error(RUN_ERROR.format(st.session_state.error))
+                # Formatting the stack is only worth paying for when someone is debugging.
+                tb = traceback.format_exc() if debug_mode else None
+                if tb: st.code(tb)
                 st.session_state.results = {}
+            finally:
+                if is_leader:
+                    # A rerun can stop this script mid-pipeline; waiters must not block until the timeout.
+                    if not future.done(): future.cancel()
+                    # Released before the session cleanup so a failing delete cannot leave this query's key behind.
+                    with inflight.lock:
+                        inflight.futures.pop(query_key, None)
+                    # Results live in st.session_state; drop the ADK session so the shared service does not grow per run.
+                    pipeline.session_service.delete_session(
+                        app_name=APP_NAME, user_id=USER_ID, session_id=current_session_id
+                    )
 
-        elif not user_query: st.warning("Please enter a description for the code.")
-        elif not ADK_AVAILABLE or not GENAI_TYPES_AVAILABLE: st.error("Cannot run pipeline: Required libraries missing.")
+        elif not user_query: st.warning(EMPTY_QUERY_WARNING)
+        elif not adk.available: st.error(MISSING_LIBRARIES_ERROR)
 
     if 'ran_query' in st.session_state and st.session_state.ran_query:
         st.markdown("**Last Run Request:**")
         st.info(st.session_state.ran_query)
 
-with col2:
-    st.subheader("2. Agent Pipeline Results")
-
-    if 'results' in st.session_state and st.session_state.results:
-        results = st.session_state.results
-
-        with st.expander("🖋️ Step 1: Initial Code Generation", expanded=True):
-            generated_code = clean_code_output(results.get("generated_code"))
-            if generated_code: st.code(generated_code, language="python")
-            else: st.warning("No code generated or retrieved.")
-
-        with st.expander("🔍 Step 2: Code Review", expanded=True):
-            review_comments = results.get("review_comments")
-            st.text(f"State Output: {review_comments}" if review_comments else "State Output: None")
-
-        with st.expander("🔧 Step 3: Refactored Code", expanded=True):
-            refactored_code = results.get("refactored_code")
-            st.text(f"State Output: {refactored_code}" if refactored_code else "State Output: None")
-
-        with st.expander("🚀 Step 4: Code Execution", expanded=True):
-            execution_summary = results.get("execution_summary")
-            st.text(f"State Output: {execution_summary}" if execution_summary else "State Output: None")
-
-        st.divider()
-        st.subheader("🎉 Final Generated Code")
-        final_code_to_display = clean_code_output(results.get("generated_code"))
-        if final_code_to_display: st.code(final_code_to_display, language="python")
-        else: st.error("Could not retrieve the generated code from session state.")
-
-        st.markdown("---")
-        st.caption("Powered by Streamlit and Google ADK")
-
-    elif 'error' in st.session_state and st.session_state.error:
-        st.error(f"Pipeline execution failed.")
-    elif not ADK_AVAILABLE:
-        st.info("Enter a request and click 'Run Debug Pipeline' once ADK libraries are available.")
-    else:
-        st.info("Enter a request on the left to see the results here.")
+# Each branch replaces the results area with a single element, dropping any streamed step panels.
+if 'results' in st.session_state and st.session_state.results:
+    results_area.markdown(st.session_state.results["html"], unsafe_allow_html=True)
+elif 'error' in st.session_state and st.session_state.error:
+    results_area.error(FAILED_RESULTS_ERROR)
+elif not adk.available:
+    results_area.info(ADK_MISSING_RESULTS_INFO)
+else:
+    results_area.info(IDLE_RESULTS_INFO)